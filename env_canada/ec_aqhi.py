@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from datetime import datetime, timezone
 
@@ -139,21 +140,24 @@ class ECAirQuality:
         self.current_timestamp = None
         self.forecasts = dict(daily={}, hourly={})
 
-    async def get_aqhi_data(self, url):
-        async with ClientSession(raise_for_status=True) as session:
-            try:
-                response = await session.get(
-                    url.format(self.zone_id, self.region_id),
-                    headers={"User-Agent": USER_AGENT},
-                    timeout=10,
-                )
-            except Exception:
-                LOG.debug("Retrieving AQHI failed", exc_info=True)
-                return None
+    async def get_aqhi_data(self, url, session=None):
+        if session is None:
+            async with ClientSession(raise_for_status=True) as session:
+                return await self.get_aqhi_data(url, session)
+
+        try:
+            response = await session.get(
+                url.format(self.zone_id, self.region_id),
+                headers={"User-Agent": USER_AGENT},
+                timeout=10,
+            )
+        except Exception:
+            LOG.debug("Retrieving AQHI failed", exc_info=True)
+            return None
 
-            result = await response.read()
-            aqhi_xml = result
-            return et.fromstring(aqhi_xml)
+        result = await response.read()
+        aqhi_xml = result
+        return et.fromstring(aqhi_xml)
 
     async def update(self):
         # Find closest site if not identified
@@ -168,8 +172,12 @@ class ECAirQuality:
                 self.region_id,
             )
 
-        # Fetch current measurement
-        aqhi_current = await self.get_aqhi_data(url=AQHI_OBSERVATION_URL)
+        # Fetch current measurement and forecasts together over one session
+        async with ClientSession(raise_for_status=True) as session:
+            aqhi_current, aqhi_forecast = await asyncio.gather(
+                self.get_aqhi_data(url=AQHI_OBSERVATION_URL, session=session),
+                self.get_aqhi_data(url=AQHI_FORECAST_URL, session=session),
+            )
 
         if aqhi_current is not None:
             # Update region name
@@ -199,8 +207,6 @@ class ECAirQuality:
             )
 
         # Update AQHI forecasts
-        aqhi_forecast = await self.get_aqhi_data(url=AQHI_FORECAST_URL)
-
         if aqhi_forecast is not None:
             # Update AQHI daily forecasts
             for f in aqhi_forecast.findall("./forecastGroup/forecast"):
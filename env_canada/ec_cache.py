@@ -1,15 +1,20 @@
+import heapq
 from datetime import datetime
 from typing import Any, ClassVar
 
 
 class Cache:
     _cache: ClassVar[dict[str, tuple[datetime, Any]]] = {}
+    # Expiry times in a heap, so expired entries are found without a full scan
+    _expiries: ClassVar[list[tuple[datetime, str]]] = []
 
     @classmethod
     def add(cls, cache_key, item, cache_time):
         """Add an entry to the cache."""
 
-        cls._cache[cache_key] = (datetime.now() + cache_time, item)
+        expiry = datetime.now() + cache_time
+        cls._cache[cache_key] = (expiry, item)
+        heapq.heappush(cls._expiries, (expiry, cache_key))
         return item  # Returning item useful for chaining calls
 
     @classmethod
@@ -18,9 +23,11 @@ class Cache:
 
         # Delete expired entries at start so we don't use expired entries
         now = datetime.now()
-        expired = [key for key, value in cls._cache.items() if value[0] < now]
-        for key in expired:
-            del cls._cache[key]
+        while cls._expiries and cls._expiries[0][0] < now:
+            expiry, key = heapq.heappop(cls._expiries)
+            # A key added again since has a later expiry of its own
+            if (entry := cls._cache.get(key)) and entry[0] == expiry:
+                del cls._cache[key]
 
         result = cls._cache.get(cache_key)
         return result[1] if result else None
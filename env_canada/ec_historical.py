@@ -2,6 +2,7 @@ import asyncio
 import copy
 import csv
 import logging
+from contextlib import nullcontext
 from datetime import datetime
 from io import StringIO
 
@@ -240,7 +241,7 @@ class ECHistorical:
         self.metadata = {}
         self.station_data = {}
 
-    async def update(self):
+    async def update(self, session=None):
         """Get the historical data from Environment Canada."""
 
         params = {
@@ -252,9 +253,11 @@ class ECHistorical:
             "submit": self.submit,
         }
 
-        # Get historical weather data
+        # Get historical weather data, over the caller's session if given
 
-        async with ClientSession(raise_for_status=True) as session:
+        async with (
+            nullcontext(session) if session else ClientSession(raise_for_status=True)
+        ) as session:
             response = await session.get(
                 WEATHER_URL.format(self.language[0]),
                 params=params,
@@ -439,9 +442,20 @@ class ECHistoricalRange:
             for year, month in self.months
         ]
 
-        for data in ec:
-            asyncio.run(data.update())
-            self.df = pd.concat((self.df, pd.read_csv(data.station_data)))
+        async def update_all():
+            # Fetch a few months at a time over one session, rather than every
+            # month of a long range at once
+            semaphore = asyncio.Semaphore(4)
+
+            async def update(data):
+                async with semaphore:
+                    await data.update(session)
+
+            async with ClientSession(raise_for_status=True) as session:
+                await asyncio.gather(*map(update, ec))
+
+        asyncio.run(update_all())
+        self.df = pd.concat([pd.read_csv(data.station_data) for data in ec])
 
         self.df = self.df.set_index(
             self.df.filter(regex="Date/*", axis=1).columns.to_numpy()[0]
@@ -1,12 +1,16 @@
+import codecs
 import csv
 import io
+import math
+from datetime import timedelta
 
+import numpy as np
 import voluptuous as vol
 from aiohttp import ClientSession
 from dateutil.parser import isoparse
-from geopy import distance
 
 from .constants import USER_AGENT
+from .ec_cache import Cache
 
 SITE_LIST_URL = "https://dd.weather.gc.ca/hydrometric/doc/hydrometric_StationList.csv"
 READINGS_URL = "https://dd.weather.gc.ca/hydrometric/csv/{prov}/hourly/{prov}_{station}_hourly_hydrometric.csv"
@@ -15,6 +19,30 @@ READINGS_URL = "https://dd.weather.gc.ca/hydrometric/csv/{prov}/hourly/{prov}_{s
 __all__ = ["ECHydro"]
 
 
+async def _read_csv(response):
+    """Yield the rows of a CSV response as dicts while it streams in."""
+
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    header = None
+    text = ""
+
+    async for line in response.content:
+        text += decoder.decode(line)
+        # A quoted field can span lines, so wait for its closing quote
+        if text.count('"') % 2:
+            continue
+        if header is None:
+            header = [h.split("/")[0].strip() for h in text.split(",")]
+        else:
+            for row in csv.DictReader(io.StringIO(text), fieldnames=header):
+                yield row
+        text = ""
+
+    if header is not None and (text := text + decoder.decode(b"", final=True)):
+        for row in csv.DictReader(io.StringIO(text), fieldnames=header):
+            yield row
+
+
 async def get_hydro_sites():
     """Get list of all sites from Environment Canada, for auto-config."""
 
@@ -24,34 +52,41 @@ async def get_hydro_sites():
         response = await session.get(
             SITE_LIST_URL, headers={"User-Agent": USER_AGENT}, timeout=10
         )
-        result = await response.read()
-    sites_csv_string = result.decode("utf-8-sig")
-    sites_csv_stream = io.StringIO(sites_csv_string)
+        async for site in _read_csv(response):
+            # Ignore bad site data
+            if site["Latitude"] is not None:
+                site["Latitude"] = float(site["Latitude"])
+                site["Longitude"] = float(site["Longitude"])
+                sites.append(site)
 
-    header = [h.split("/")[0].strip() for h in sites_csv_stream.readline().split(",")]
-    sites_reader = csv.DictReader(sites_csv_stream, fieldnames=header)
+    return sites
 
-    for site in sites_reader:
-        # Ignore bad site data
-        if site["Latitude"] is not None:
-            site["Latitude"] = float(site["Latitude"])
-            site["Longitude"] = float(site["Longitude"])
-            sites.append(site)
 
-    return sites
+def _haversine(lat, lon, lats, lons, cos_lats):
+    """Return the haversine term, which orders points by great-circle distance."""
+    return (
+        np.sin((lats - lat) / 2) ** 2
+        + math.cos(lat) * cos_lats * np.sin((lons - lon) / 2) ** 2
+    )
 
 
 async def closest_site(lat, lon):
     """Return the province/site_code of the closest station to our lat/lon."""
-    site_list = await get_hydro_sites()
 
-    def site_distance(site):
-        """Calculate distance to a site."""
-        return distance.distance((lat, lon), (site["Latitude"], site["Longitude"]))
+    # Keep the station coordinates in radians so repeat lookups skip the rebuild
+    if not (sites := Cache.get("hydro-sites")):
+        site_list = await get_hydro_sites()
+        lats = np.radians([site["Latitude"] for site in site_list])
+        lons = np.radians([site["Longitude"] for site in site_list])
+        sites = Cache.add(
+            "hydro-sites", (site_list, lats, lons, np.cos(lats)), timedelta(days=1)
+        )
+    site_list, lats, lons, cos_lats = sites
 
-    closest = min(site_list, key=site_distance)
+    # The haversine term grows with great-circle distance, so compare it directly
+    distances = _haversine(math.radians(lat), math.radians(lon), lats, lons, cos_lats)
 
-    return closest
+    return site_list[int(np.argmin(distances))]
 
 
 class ECHydro:
@@ -114,25 +149,19 @@ class ECHydro:
 
         # Get hydrometric data
 
+        latest = None
+
         async with ClientSession(raise_for_status=True) as session:
             response = await session.get(
                 READINGS_URL.format(prov=self.province, station=self.station),
                 headers={"User-Agent": USER_AGENT},
                 timeout=10,
             )
-            result = await response.read()
-        hydro_csv_string = result.decode("utf-8-sig")
-        hydro_csv_stream = io.StringIO(hydro_csv_string)
-
-        header = [
-            h.split("/")[0].strip() for h in hydro_csv_stream.readline().split(",")
-        ]
-        readings_reader = csv.DictReader(hydro_csv_stream, fieldnames=header)
-
-        readings = [r for r in readings_reader]
-        if len(readings) > 0:
-            latest = readings[-1]
+            # Only the most recent reading is used, so don't keep the rest
+            async for reading in _read_csv(response):
+                latest = reading
 
+        if latest is not None:
             if latest["Water Level"] != "":
                 self.measurements["water_level"] = {
                     "label": "Water Level",
@@ -147,4 +176,4 @@ class ECHydro:
                     "unit": "m³/s",
                 }
 
-            self.timestamp = isoparse(readings[-1]["Date"])
+            self.timestamp = isoparse(latest["Date"])
@@ -2,13 +2,19 @@ import asyncio
 import logging
 import math
 import os
-from datetime import date, timedelta
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from io import BytesIO
-from typing import cast
+from typing import ClassVar, cast
+from weakref import WeakKeyDictionary
 
 import dateutil.parser
+import numpy as np
 import voluptuous as vol
-from aiohttp import ClientSession
+from aiohttp import ClientSession, TCPConnector
 from aiohttp.client_exceptions import ClientConnectorError
 from lxml import etree as et
 from PIL import Image, ImageDraw, ImageFont
@@ -23,6 +29,8 @@ ATTRIBUTION = {
 
 __all__ = ["ECRadar"]
 
+LOG = logging.getLogger(__name__)
+
 # Natural Resources Canada
 
 basemap_url = "https://maps.geogratis.gc.ca/wms/CBMT"
@@ -56,7 +64,7 @@ capabilities_params = {
     "request": "GetCapabilities",
 }
 wms_namespace = {"wms": "http://www.opengis.net/wms"}
-dimension_xpath = './/wms:Layer[wms:Name="{layer}"]/wms:Dimension'
+wms_layer_tag = "{http://www.opengis.net/wms}Layer"
 radar_params = {
     "service": "WMS",
     "version": "1.3.0",
@@ -78,75 +86,351 @@ timestamp_label = {
     "snow": {"english": "Snow", "french": "Neige"},
 }
 
+earth_radius_km = 6371.01
+
+basemap_cache_time = timedelta(days=7)
+
+# Rows of radar blended together; bands without any radar are skipped
+blend_band_height = 64
+
+# The timestamp font is a fixed-width bitmap font, so text size is arithmetic
+font = ImageFont.load(os.path.join(os.path.dirname(__file__), "10x20.pil"))
+font_width, font_height = font.getbbox("0")[2:]
 
+
+@lru_cache(maxsize=128)
 def _compute_bounding_box(distance, latittude, longitude):
     """
     Modified from https://gist.github.com/alexcpn/f95ae83a7ee0293a5225
     """
-    latittude = math.radians(latittude)
-    longitude = math.radians(longitude)
+    angular_distance = distance / earth_radius_km
+    delta_latitude = math.degrees(angular_distance)
+    delta_longitude = math.degrees(
+        math.asin(math.sin(angular_distance) / math.cos(math.radians(latittude)))
+    )
+
+    # Coordinates are rounded when they're formatted into the request
+    return (
+        latittude - delta_latitude,
+        longitude - delta_longitude,
+        latittude + delta_latitude,
+        longitude + delta_longitude,
+    )
+
+
+def _parse_dimensions(capabilities_xml, layer):
+    """Extract the (start, end) time range of a layer from capabilities XML."""
+
+    # Stream the layers and stop at the one we want rather than building the
+    # whole tree; layers already passed over are cleared to bound memory
+    dimension = None
+    for _, element in et.iterparse(
+        BytesIO(capabilities_xml), tag=wms_layer_tag, remove_blank_text=True
+    ):
+        if element.findtext("wms:Name", namespaces=wms_namespace) == layer:
+            dimension = element.findtext("wms:Dimension", namespaces=wms_namespace)
+            break
+        element.clear(keep_tail=True)
+
+    if not dimension:
+        return None
+    start, _, period = dimension.partition("/")
+    end = period.partition("/")[0]
+    return (dateutil.parser.isoparse(start), dateutil.parser.isoparse(end))
+
 
-    distance_from_point_km = distance
-    angular_distance = distance_from_point_km / 6371.01
+def _format_frame_time(frame_time):
+    """Format a frame time as a WMS TIME value, e.g. 2024-01-01T12:06:00Z."""
+    return (
+        f"{frame_time.year:04d}-{frame_time.month:02d}-{frame_time.day:02d}"
+        f"T{frame_time.hour:02d}:{frame_time.minute:02d}:00Z"
+    )
 
-    lat_min = latittude - angular_distance
-    lat_max = latittude + angular_distance
 
-    delta_longitude = math.asin(math.sin(angular_distance) / math.cos(latittude))
+def _seasonal_precip_type(day):
+    """Return the precipitation type shown on a day when it is set to auto."""
+    return "rain" if day.month in range(4, 11) else "snow"
 
-    lon_min = longitude - delta_longitude
-    lon_max = longitude + delta_longitude
-    lon_min = round(math.degrees(lon_min), 5)
-    lat_max = round(math.degrees(lat_max), 5)
-    lon_max = round(math.degrees(lon_max), 5)
-    lat_min = round(math.degrees(lat_min), 5)
 
-    return lat_min, lon_min, lat_max, lon_max
+@lru_cache(maxsize=8)
+def _opacity_table(opacity):
+    """Map each 8-bit alpha to itself scaled by opacity percent, as uint16."""
+    # A table lookup per pixel replaces an integer multiply and divide
+    table = np.arange(256, dtype=np.uint16) * opacity // 100
+    table.flags.writeable = False
+    return table
 
 
-async def _get_resource(url, params, bytes=True):
-    async with ClientSession(raise_for_status=True) as session:
-        response = await session.get(
-            url=url, params=params, headers={"User-Agent": USER_AGENT}
+def _palette_rgba(image):
+    """Expand the palette of a "P" image, with its transparency, to 256 RGBA rows."""
+    strip = Image.new("P", (256, 1))
+    strip.putdata(range(256))
+    strip.putpalette(image.getpalette())
+    if "transparency" in image.info:
+        strip.info["transparency"] = image.info["transparency"]
+    return np.asarray(strip.convert("RGBA"))[0]
+
+
+def _blend_radar(background, radar_image, opacity, hidden_box=None):
+    """Blend a radar image over an opaque RGB pixel array at opacity percent.
+
+    Radar inside hidden_box, such as under the legend, is left out.
+    """
+
+    # Each frame starts from a plain copy of the background pixels
+    frame = background.copy()
+
+    # GeoMet sends palette images; keep them at one byte per pixel and only
+    # expand colours through the palette where the radar is visible
+    if radar_image.mode == "P":
+        palette = _palette_rgba(radar_image)
+        radar = np.asarray(radar_image)
+        alpha_plane = palette[:, 3][radar]
+    else:
+        palette = None
+        radar = np.asarray(
+            radar_image if radar_image.mode == "RGBA" else radar_image.convert("RGBA")
+        )
+        alpha_plane = np.array(radar[..., 3])
+    if hidden_box:
+        left, top, right, bottom = hidden_box
+        alpha_plane[top:bottom, left:right] = 0
+
+    if opacity == 0:
+        return Image.fromarray(frame)
+
+    # Most of a radar image is clear sky, and storm cells are scattered. Blend
+    # each band of rows only between its first and last visible columns, and
+    # keep the basemap as is everywhere else
+    visible_rows = alpha_plane.any(axis=1)
+    for top in range(0, len(visible_rows), blend_band_height):
+        bottom = top + blend_band_height
+        if not visible_rows[top:bottom].any():
+            continue
+        cols = np.flatnonzero(alpha_plane[top:bottom].any(axis=0))
+        left, right = cols[0], cols[-1] + 1
+
+        window = radar[top:bottom, left:right]
+        _blend_window(
+            frame[top:bottom, left:right],
+            window if palette is None else palette[window],
+            alpha_plane[top:bottom, left:right, np.newaxis],
+            opacity,
         )
+    return Image.fromarray(frame)
+
+
+def _blend_window(base, radar, alpha, opacity):
+    """Blend RGBA radar pixels into an RGB window in place."""
+
+    # Scale the radar alpha by the opacity, then blend each channel as
+    # radar * a + base * (255 - a) in 16-bit integers, which cannot overflow
+    if opacity == 100:
+        alpha = alpha.astype(np.uint16)
+    else:
+        alpha = _opacity_table(opacity)[alpha]
+    blended = base * (255 - alpha)
+    blended += radar[..., :3] * alpha
+
+    # Divide by 255 with correct rounding using only adds and shifts, in place:
+    # x / 255 == (x + 128 + ((x + 128) >> 8)) >> 8 for x <= 255 * 255
+    blended += 128
+    blended += blended >> 8
+    blended >>= 8
+
+    base[:] = blended
+
+
+def _open_png(png):
+    """Open PNG bytes without probing every other image format first."""
+    return Image.open(BytesIO(png), formats=["PNG"])
+
+
+def _decode_basemap(base_bytes):
+    """Decode basemap PNG bytes into an RGB image for compositing."""
+    # The basemap is opaque, so it doesn't need an alpha channel of its own
+    return Image.open(BytesIO(base_bytes)).convert("RGB")
+
+
+def _compose_background(base_image, legend_bytes):
+    """Lay the legend, if any, over the basemap and return its pixel array.
+
+    Returns the array and the box the legend covers, if any.
+    """
+    legend_box = None
+    if legend_bytes:
+        base_image, legend_box = _paste_legend(base_image, legend_bytes)
+    return np.asarray(base_image), legend_box
+
+
+def _paste_legend(image, legend_bytes):
+    """Paste the legend into the top right corner of a copy of an image.
+
+    Returns the new image and the box the legend covers.
+    """
+    legend = _open_png(legend_bytes).convert("RGB")
+    legend_box = (image.width - legend.width, 0, image.width, legend.height)
+    image = image.copy()
+    image.paste(legend, legend_box)
+    return image, legend_box
+
+
+@lru_cache(maxsize=64)
+def _timestamp_mask(text):
+    """Render timestamp text as a 1-band mask at twice the font size."""
+    # Callers only read the mask, so a cached one can be pasted from any thread
+    text_mask = Image.new("L", (font_width * len(text), font_height))
+    ImageDraw.Draw(text_mask).text(xy=(0, 0), text=text, fill=255, font=font)
+    return text_mask.resize(
+        (text_mask.width * 2, text_mask.height * 2), Image.Resampling.NEAREST
+    )
+
+
+def _gif_palette(png, frame):
+    """Build the palette shared by every frame of a GIF loop."""
+    image = frame if frame is not None else _open_png(png)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    # A map with a few flat radar colours doesn't need median cut's slower search
+    return image.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+
+
+def _loop_frame(png, frame, palette=None):
+    """Prepare one composed radar frame for the loop encoder."""
+    # Only frames that came from the cache need decoding
+    image = frame if frame is not None else _open_png(png)
+    if palette is None:
+        return image
+    # Blended frames are RGB already; converting them would only copy them
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return image.quantize(palette=palette, dither=Image.Dither.NONE)
+
+
+def _read_cache_file(path, max_age):
+    """Read a file if it was written within max_age, otherwise return None."""
+    try:
+        age = datetime.now().timestamp() - os.path.getmtime(path)
+        if age < max_age.total_seconds():
+            with open(path, "rb") as cache_file:
+                return cache_file.read()
+    except OSError:
+        pass
+    return None
+
+
+def _write_cache_file(path, data):
+    """Write a file atomically so a concurrent reader never sees part of it."""
+    temp_path = None
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # A unique temporary file, as other threads may be writing the same path
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as cache_file:
+            cache_file.write(data)
+        os.replace(temp_path, path)
+    except OSError as e:
+        LOG.warning("Could not write cache file %s: %s", path, e)
+        if temp_path is not None:
+            with suppress(OSError):
+                os.unlink(temp_path)
+
+
+def _client_session():
+    """Create a session whose connections are reused across a batch of requests."""
+    return ClientSession(
+        # GeoMet throughput levels off at a handful of parallel requests
+        connector=TCPConnector(limit_per_host=8, ttl_dns_cache=300),
+        raise_for_status=True,
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+async def _get_resource(url, params, bytes=True, session=None):
+    if session is None:
+        async with _client_session() as session:
+            return await _get_resource(url, params, bytes, session)
+
+    async with session.get(url=url, params=params) as response:
         if bytes:
             return await response.read()
         return await response.text()
 
 
+async def _revalidate_resource(url, params, validators, session=None):
+    """Fetch a resource unless it is unchanged since the given (ETag, Last-Modified).
+
+    Returns the body, or None if unchanged, along with the new validators.
+    """
+    if session is None:
+        async with _client_session() as session:
+            return await _revalidate_resource(url, params, validators, session)
+
+    etag, last_modified = validators
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with session.get(url=url, params=params, headers=headers) as response:
+        if response.status == 304:
+            return None, validators
+        validators = (
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+        return await response.read(), validators
+
+
+init_schema = vol.Schema(
+    {
+        vol.Required("coordinates"): (
+            vol.All(vol.Or(int, float), vol.Range(-90, 90)),
+            vol.All(vol.Or(int, float), vol.Range(-180, 180)),
+        ),
+        vol.Required("radius", default=200): vol.All(int, vol.Range(min=10)),
+        vol.Required("width", default=800): vol.All(int, vol.Range(min=10)),
+        vol.Required("height", default=800): vol.All(int, vol.Range(min=10)),
+        vol.Required("legend", default=True): bool,
+        vol.Required("timestamp", default=True): bool,
+        vol.Required("radar_opacity", default=65): vol.All(int, vol.Range(0, 100)),
+        vol.Optional("precip_type"): vol.Any(None, vol.In(["rain", "snow", "auto"])),
+        vol.Optional("language", default="english"): vol.In(["english", "french"]),
+        vol.Optional("loop_format", default="gif"): vol.In(["gif", "webp"]),
+        vol.Optional("cache_dir", default=None): vol.Any(None, str),
+    }
+)
+
+
 class ECRadar:
+    # PIL releases the GIL in its C code, so frames composite in parallel here
+    # without contending with other users of the event loop's default executor
+    _pil_executor = ThreadPoolExecutor(
+        max_workers=os.cpu_count() or 4, thread_name_prefix="ec_radar_pil"
+    )
+    # Sessions and futures belong to the event loop that created them, so the
+    # state shared between radars below is kept per loop.
+    # Fetches in progress, by cache key, shared by radars covering the same map
+    _in_flight: ClassVar[
+        WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Future]]
+    ] = WeakKeyDictionary()
+    # A session shared by every radar and its number of leases; it stays open
+    # while any are held, so a shared fetch never outlives its connections
+    _sessions: ClassVar[
+        WeakKeyDictionary[asyncio.AbstractEventLoop, tuple[ClientSession, int]]
+    ] = WeakKeyDictionary()
+
     def __init__(self, **kwargs):
         """Initialize the radar object."""
 
-        init_schema = vol.Schema(
-            {
-                vol.Required("coordinates"): (
-                    vol.All(vol.Or(int, float), vol.Range(-90, 90)),
-                    vol.All(vol.Or(int, float), vol.Range(-180, 180)),
-                ),
-                vol.Required("radius", default=200): vol.All(int, vol.Range(min=10)),
-                vol.Required("width", default=800): vol.All(int, vol.Range(min=10)),
-                vol.Required("height", default=800): vol.All(int, vol.Range(min=10)),
-                vol.Required("legend", default=True): bool,
-                vol.Required("timestamp", default=True): bool,
-                vol.Required("radar_opacity", default=65): vol.All(
-                    int, vol.Range(0, 100)
-                ),
-                vol.Optional("precip_type"): vol.Any(
-                    None, vol.In(["rain", "snow", "auto"])
-                ),
-                vol.Optional("language", default="english"): vol.In(
-                    ["english", "french"]
-                ),
-            }
-        )
-
         kwargs = init_schema(kwargs)
         self.language = kwargs["language"]
         self.metadata = {"attribution": ATTRIBUTION[self.language]}
 
         self._precip_type_setting = kwargs.get("precip_type")
-        self._precip_type_actual = self.precip_type[1]
+        self._precip_type_day = None
+        self._resolve_precip_type()
 
         # Get map parameters
         self.image = None
@@ -154,64 +438,205 @@ class ECRadar:
         self.height = kwargs["height"]
         self.bbox = _compute_bounding_box(kwargs["radius"], *kwargs["coordinates"])
         self.map_params = {
-            "bbox": ",".join([str(coord) for coord in self.bbox]),
+            "bbox": ",".join(f"{coord:.5f}" for coord in self.bbox),
             "width": self.width,
             "height": self.height,
         }
+        self._basemap_params = {**basemap_params, **self.map_params}
+        # GetMap parameters for each layer, to which frames only add a time
+        self._layer_params = {
+            precip: {**radar_params, **self.map_params, "layers": layer}
+            for precip, layer in precip_layers.items()
+        }
+        # Instances covering different areas or sizes must not share images
+        self._map_key = f"{self.width}x{self.height}-{self.map_params['bbox']}"
         self.radar_opacity = kwargs["radar_opacity"]
 
         # Get overlay parameters
         self.show_legend = kwargs["legend"]
         self.show_timestamp = kwargs["timestamp"]
-
-        self._font = None
+        self.loop_format = kwargs["loop_format"]
+
+        # Optionally keep basemaps on disk so new processes can skip the download
+        self.cache_dir = kwargs["cache_dir"]
+
+        # Set while the radar is used with `async with`
+        self._session = None
+
+    async def __aenter__(self):
+        if self._session is None:
+            self._session = self._lease_session()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Release the HTTP session kept open by `async with`."""
+        if self._session is not None:
+            self._session = None
+            await self._release_session()
+
+    @classmethod
+    def _lease_session(cls):
+        """Take a lease on the loop's shared session, opening it if none is held."""
+        loop = asyncio.get_running_loop()
+        session, leases = cls._sessions.get(loop, (None, 0))
+        if session is None:
+            session = _client_session()
+        cls._sessions[loop] = (session, leases + 1)
+        return session
+
+    @classmethod
+    async def _release_session(cls):
+        """Return a lease on the loop's shared session, closing it after the last."""
+        loop = asyncio.get_running_loop()
+        session, leases = cls._sessions[loop]
+        if leases > 1:
+            cls._sessions[loop] = (session, leases - 1)
+        else:
+            del cls._sessions[loop]
+            await session.close()
+
+    @asynccontextmanager
+    async def _session_scope(self):
+        """Hold a lease on the shared session for the duration of a call."""
+        session = self._lease_session()
+        try:
+            yield session
+        finally:
+            await self._release_session()
+
+    async def _coalesce(self, cache_key, fetch):
+        """Await fetch(session), sharing it with callers fetching the same key."""
+        fetches = self._in_flight.setdefault(asyncio.get_running_loop(), {})
+        if (in_flight := fetches.get(cache_key)) is None:
+
+            async def leased_fetch():
+                # The fetch holds its own lease, so the callers that started it
+                # can finish or be cancelled without closing its session
+                async with self._session_scope() as session:
+                    return await fetch(session)
+
+            in_flight = asyncio.ensure_future(leased_fetch())
+            fetches[cache_key] = in_flight
+            in_flight.add_done_callback(lambda _: fetches.pop(cache_key))
+        # One caller being cancelled must not cancel the fetch for the others
+        return await asyncio.shield(in_flight)
 
     @property
     def precip_type(self):
         # NOTE: this is a breaking change for this lib; HA doesn't use this so not breaking for that
         if self._precip_type_setting in ["rain", "snow"]:
             return (self._precip_type_setting, self._precip_type_setting)
-        self._precip_type_actual = (
-            "rain" if date.today().month in range(4, 11) else "snow"
-        )
-        return ("auto", self._precip_type_actual)
+        return ("auto", _seasonal_precip_type(date.today()))
 
     @precip_type.setter
     def precip_type(self, user_input):
         if user_input not in ["rain", "snow", "auto"]:
             raise ValueError("precip_type must be 'rain', 'snow', or 'auto'")
         self._precip_type_setting = user_input
-        self._precip_type_actual = self.precip_type[1]
+        self._precip_type_day = None
+        self._resolve_precip_type()
+
+    def _resolve_precip_type(self):
+        """Update the precipitation type shown, choosing by season daily if auto."""
+        if self._precip_type_setting in ["rain", "snow"]:
+            self._precip_type_actual = self._precip_type_setting
+        elif (today := date.today()) != self._precip_type_day:
+            self._precip_type_day = today
+            self._precip_type_actual = _seasonal_precip_type(today)
 
-    async def _get_basemap(self):
+    async def _get_basemap(self, session=None):
         """Fetch the background map image."""
-        if base_bytes := Cache.get("basemap"):
+        basemap_cache_key = f"basemap-{self._map_key}"
+        if base_bytes := Cache.get(basemap_cache_key):
             return base_bytes
 
-        basemap_params.update(self.map_params)
+        loop = asyncio.get_running_loop()
+        cache_path = None
+        if self.cache_dir:
+            cache_path = os.path.join(self.cache_dir, f"{basemap_cache_key}.png")
+            if base_bytes := await loop.run_in_executor(
+                None, _read_cache_file, cache_path, basemap_cache_time
+            ):
+                return Cache.add(basemap_cache_key, base_bytes, basemap_cache_time)
+
         for map_url in [basemap_url, backup_map_url]:
             try:
-                base_bytes = await _get_resource(map_url, basemap_params)
-                return Cache.add("basemap", base_bytes, timedelta(days=7))
+                base_bytes = await _get_resource(
+                    map_url, self._basemap_params, session=session
+                )
+                if cache_path:
+                    await loop.run_in_executor(
+                        None, _write_cache_file, cache_path, base_bytes
+                    )
+                return Cache.add(basemap_cache_key, base_bytes, basemap_cache_time)
 
             except ClientConnectorError as e:
                 logging.warning("Map from %s could not be retrieved: %s", map_url, e)
 
-    async def _get_legend(self):
+    async def _get_base_image(self, session=None):
+        """Fetch the background map decoded for compositing."""
+        base_image_cache_key = f"basemap-image-{self._map_key}"
+        if base_image := Cache.get(base_image_cache_key):
+            return base_image
+
+        if not (base_bytes := await self._get_basemap(session)):
+            return None
+        base_image = await asyncio.get_running_loop().run_in_executor(
+            self._pil_executor, _decode_basemap, base_bytes
+        )
+        # Frames only ever read the decoded map, so it is safe to share
+        return Cache.add(base_image_cache_key, base_image, basemap_cache_time)
+
+    async def _get_background(self):
+        """Get the decoded basemap with the legend, if shown, pasted onto it.
+
+        Returns the background as a pixel array and the box the legend covers.
+        """
+        background_cache_key = (
+            f"background-{self._precip_type_actual}-{self.show_legend}-{self._map_key}"
+        )
+        if background := Cache.get(background_cache_key):
+            return background
+        return await self._coalesce(
+            background_cache_key,
+            lambda session: self._build_background(background_cache_key, session),
+        )
+
+    async def _build_background(self, background_cache_key, session):
+        """Fetch the basemap and legend and compose them into a background."""
+        base_image, legend_bytes = await asyncio.gather(
+            self._get_base_image(session),
+            self._get_legend(session) if self.show_legend else asyncio.sleep(0),
+        )
+        if base_image is None:
+            return None, None
+
+        background = await asyncio.get_running_loop().run_in_executor(
+            self._pil_executor, _compose_background, base_image, legend_bytes
+        )
+        # Retry a legend that failed to load next time rather than caching
+        # a background without it
+        if self.show_legend and not legend_bytes:
+            return background
+        return Cache.add(background_cache_key, background, basemap_cache_time)
+
+    async def _get_legend(self, session=None):
         """Fetch legend image."""
 
         legend_cache_key = f"legend-{self._precip_type_actual}"
         if legend := Cache.get(legend_cache_key):
             return legend
 
-        legend_params.update(
-            dict(
-                layer=precip_layers[self._precip_type_actual],
-                style=legend_style[self._precip_type_actual],
-            )
-        )
+        params = {
+            **legend_params,
+            "layer": precip_layers[self._precip_type_actual],
+            "style": legend_style[self._precip_type_actual],
+        }
         try:
-            legend = await _get_resource(geomet_url, legend_params)
+            legend = await _get_resource(geomet_url, params, session=session)
             return Cache.add(legend_cache_key, legend, timedelta(days=7))
 
         except ClientConnectorError:
@@ -221,157 +646,227 @@ class ECRadar:
     async def _get_dimensions(self):
         """Get time range of available radar images."""
 
-        capabilities_cache_key = f"capabilities-{self._precip_type_actual}"
+        layer = precip_layers[self._precip_type_actual]
+        dimensions_cache_key = f"dimensions-{layer}"
 
-        if not (capabilities_xml := Cache.get(capabilities_cache_key)):
-            capabilities_params["layer"] = precip_layers[self._precip_type_actual]
-            capabilities_xml = await _get_resource(
-                geomet_url, capabilities_params, bytes=True
+        if not (dimensions := Cache.get(dimensions_cache_key)):
+            dimensions = await self._coalesce(
+                dimensions_cache_key,
+                lambda session: self._fetch_dimensions(layer, session),
             )
-            Cache.add(capabilities_cache_key, capabilities_xml, timedelta(minutes=5))
-
-        dimension_string = et.fromstring(capabilities_xml).find(
-            dimension_xpath.format(layer=precip_layers[self._precip_type_actual]),
-            namespaces=wms_namespace,
+            if not dimensions:
+                return None
+
+        self.timestamp = dimensions[1].isoformat()
+        return dimensions
+
+    async def _fetch_dimensions(self, layer, session):
+        """Fetch and parse the time range of a radar layer."""
+        params = {**capabilities_params, "layer": layer}
+
+        # Once fresh dimensions expire, ask the server whether the
+        # capabilities changed before downloading and parsing them again
+        revalidation_cache_key = f"capabilities-{layer}"
+        validators, last_dimensions = Cache.get(revalidation_cache_key) or (
+            (None, None),
+            None,
+        )
+        capabilities_xml, validators = await _revalidate_resource(
+            geomet_url, params, validators, session=session
         )
-        if dimension_string is not None:
-            if dimension_string := dimension_string.text:
-                start, end = (
-                    dateutil.parser.isoparse(t) for t in dimension_string.split("/")[:2]
-                )
-                self.timestamp = end.isoformat()
-                return (start, end)
-        return None
 
-    async def _get_radar_image(self, frame_time):
-        def _create_image():
-            """Contains all the PIL calls; run in another thread."""
+        # Parse once per fetch and cache the result rather than the raw XML
+        if capabilities_xml is None:
+            dimensions = last_dimensions
+        elif not (dimensions := _parse_dimensions(capabilities_xml, layer)):
+            return None
+        Cache.add(f"dimensions-{layer}", dimensions, timedelta(minutes=5))
+        if any(validators):
+            Cache.add(
+                revalidation_cache_key, (validators, dimensions), timedelta(days=1)
+            )
+        return dimensions
 
-            radar_image = Image.open(BytesIO(cast(bytes, radar_bytes))).convert("RGBA")
+    async def _get_radar_image(self, frame_time, background=(None, None)):
+        def _create_image(radar_bytes, legend_bytes):
+            """Contains all the PIL calls; run in another thread."""
 
-            map_image = None
-            if base_bytes:
-                map_image = Image.open(BytesIO(base_bytes)).convert("RGBA")
+            radar_image = _open_png(cast(bytes, radar_bytes))
 
-            if legend_bytes:
-                legend_image = Image.open(BytesIO(legend_bytes)).convert("RGB")
-                legend_position = (self.width - legend_image.size[0], 0)
-            else:
-                legend_image = None
-                legend_position = None
-
-            # Add transparency to radar
-            if self.radar_opacity < 100:
-                alpha = round((self.radar_opacity / 100) * 255)
-                radar_copy = radar_image.copy()
-                radar_copy.putalpha(alpha)
-                radar_image.paste(radar_copy, radar_image)
-
-            # Overlay radar on basemap
-            if map_image:
-                frame = Image.alpha_composite(map_image, radar_image)
+            # Overlay radar on basemap, applying the radar opacity as it blends
+            if base_pixels is not None:
+                # The legend is already part of the background, so leave out
+                # the radar under it rather than pasting the legend every frame
+                frame = _blend_radar(
+                    base_pixels, radar_image, self.radar_opacity, legend_box
+                )
             else:
+                if radar_image.mode != "RGBA":
+                    radar_image = radar_image.convert("RGBA")
+                # Add transparency to radar
+                if self.radar_opacity < 100:
+                    alpha = round((self.radar_opacity / 100) * 255)
+                    # Rewrite only the alpha band in place, in one C-level pass
+                    radar_image.putalpha(
+                        radar_image.getchannel("A").point(lambda v: v * alpha // 255)
+                    )
                 frame = radar_image
-
-            # Add legend
-            if legend_image:
-                frame.paste(legend_image, legend_position)
+                if legend_bytes:
+                    frame, _ = _paste_legend(frame, legend_bytes)
 
             # Add timestamp
             if self.show_timestamp:
-                if not self._font:
-                    self._font = ImageFont.load(
-                        os.path.join(os.path.dirname(__file__), "10x20.pil")
-                    )
-
-                if self._font:
-                    label = timestamp_label[self._precip_type_actual][self.language]
-                    timestamp = f"{label} @ {frame_time.astimezone().strftime('%H:%M')}"
-                    text_box = Image.new(
-                        "RGBA", self._font.getbbox(timestamp)[2:], "white"
-                    )
-                    box_draw = ImageDraw.Draw(text_box)
-                    box_draw.text(
-                        xy=(0, 0), text=timestamp, fill=(0, 0, 0), font=self._font
-                    )
-                    double_box = text_box.resize(
-                        (text_box.width * 2, text_box.height * 2)
-                    )
-                    frame.paste(double_box)
-                    frame = frame.quantize()
-
-            # Convert frame to PNG for return
+                label = timestamp_label[self._precip_type_actual][self.language]
+                timestamp = f"{label} @ {frame_time.astimezone().strftime('%H:%M')}"
+                text_mask = _timestamp_mask(timestamp)
+                text_area = (0, 0, text_mask.width, text_mask.height)
+                frame.paste("white", text_area)
+                frame.paste("black", text_area, text_mask)
+
+            # Convert frame to PNG for the cache
             img_byte_arr = BytesIO()
             frame.save(img_byte_arr, format="PNG")
 
             # Time is tuned for 3h radar image
-            return Cache.add(
-                f"radar-{time}", img_byte_arr.getvalue(), timedelta(minutes=200)
+            png = Cache.add(
+                radar_cache_key, img_byte_arr.getvalue(), timedelta(minutes=200)
             )
+            # Hand back the frame too, so a loop doesn't have to decode the PNG
+            return png, frame
+
+        time = _format_frame_time(frame_time)
+        # Frames are shared only with radars that would draw them the same way
+        radar_cache_key = (
+            f"radar-{self._precip_type_actual}-{self._map_key}-{self.radar_opacity}"
+            f"-{self.show_legend}-{self.show_timestamp}-{self.language}-{time}"
+        )
 
-        time = frame_time.strftime("%Y-%m-%dT%H:%M:00Z")
+        if img := Cache.get(radar_cache_key):
+            return img, None
 
-        if img := Cache.get(f"radar-{time}"):
-            return img
+        base_pixels, legend_box = background
 
-        base_bytes = await self._get_basemap()
-        legend_bytes = await self._get_legend() if self.show_legend else None
+        async def fetch_and_compose(session):
+            legend_bytes = None
+            if base_pixels is None and self.show_legend:
+                legend_bytes = await self._get_legend(session)
 
-        params = dict(
-            **radar_params,
-            **self.map_params,
-            layers=precip_layers[self._precip_type_actual],
-            time=time,
-        )
-        radar_bytes = await _get_resource(geomet_url, params)
-        return await asyncio.get_event_loop().run_in_executor(None, _create_image)
+            params = {**self._layer_params[self._precip_type_actual], "time": time}
+            radar_bytes = await _get_resource(geomet_url, params, session=session)
+            return await asyncio.get_running_loop().run_in_executor(
+                self._pil_executor, _create_image, radar_bytes, legend_bytes
+            )
+
+        # A frame already being built for an overlapping call is awaited, not
+        # fetched again
+        return await self._coalesce(radar_cache_key, fetch_and_compose)
 
     async def get_latest_frame(self):
         """Get the latest image from Environment Canada."""
-        dimensions = await self._get_dimensions()
-        if not dimensions:
-            return None
-        return await self._get_radar_image(frame_time=dimensions[1])
+        self._resolve_precip_type()
+        # Keep the session open between the requests of this call
+        async with self._session_scope():
+            # Build the map and legend background while the dimensions load
+            dimensions, background = await asyncio.gather(
+                self._get_dimensions(), self._get_background()
+            )
+            if not dimensions:
+                return None
+            png, _ = await self._get_radar_image(
+                frame_time=dimensions[1], background=background
+            )
+            return png
 
     async def update(self):
         self.image = await self.get_loop()
 
     async def get_loop(self, fps=5):
-        """Build an animated GIF of recent radar images."""
-
-        def create_gif():
-            """Assemble animated GIF."""
-            duration = 1000 / fps
-            imgs = [Image.open(BytesIO(img)).convert("RGBA") for img in radar_layers]
-            gif = BytesIO()
-            imgs[0].save(
-                gif,
-                format="GIF",
-                save_all=True,
-                append_images=imgs[1:],
-                duration=duration,
-                loop=0,
+        """Build an animated GIF (or WebP) of recent radar images."""
+
+        def create_loop():
+            """Assemble the animated image."""
+            # Hold the latest frame for four frame times instead of encoding
+            # it four times
+            duration = round(1000 / fps)
+            durations = [duration] * (len(frames) - 1) + [duration * 4]
+            loop_bytes = BytesIO()
+
+            if self.loop_format == "webp":
+                frames[0].save(
+                    loop_bytes,
+                    format="WEBP",
+                    save_all=True,
+                    append_images=frames[1:],
+                    duration=durations,
+                    loop=0,
+                    quality=80,
+                    method=4,
+                )
+            else:
+                frames[0].save(
+                    loop_bytes,
+                    format="GIF",
+                    save_all=True,
+                    append_images=frames[1:],
+                    duration=durations,
+                    loop=0,
+                    optimize=False,
+                    # Keep each frame in place so Pillow only stores the bounding
+                    # box of what changed from the previous frame
+                    disposal=1,
+                )
+            return loop_bytes.getvalue()
+
+        loop = asyncio.get_running_loop()
+        self._resolve_precip_type()
+
+        # One session for the whole loop keeps connections to GeoMet alive
+        async with self._session_scope():
+            # Without this cache priming the tasks below each compete to load
+            # map/legend at the same time, resulting in them getting retrieved
+            # for each radar image. The requests are independent.
+            background, timespan = await asyncio.gather(
+                self._get_background(), self._get_dimensions()
             )
-            return gif.getvalue()
-
-        # Without this cache priming the tasks below each compete to load map/legend
-        # at the same time, resulting in them getting retrieved for each radar image.
-        await self._get_basemap()
-        await self._get_legend() if self.show_legend else None
-
-        timespan = await self._get_dimensions()
-        if not timespan:
-            logging.error("Cannot retrieve radar times.")
-            return None
+            if not timespan:
+                logging.error("Cannot retrieve radar times.")
+                return None
+
+            start, end = timespan
+            frame_count = (end - start) // radar_interval + 1
+            radar_tasks = [
+                asyncio.ensure_future(
+                    self._get_radar_image(
+                        frame_time=start + i * radar_interval,
+                        background=background,
+                    )
+                )
+                for i in range(frame_count)
+            ]
 
-        tasks = []
-        curr = timespan[0]
-        while curr <= timespan[1]:
-            tasks.append(self._get_radar_image(frame_time=curr))
-            curr = curr + radar_interval
-        radar_layers = await asyncio.gather(*tasks)
+            try:
+                # Every GIF frame is quantized to the first frame's palette; build
+                # it as soon as that frame lands while the rest are downloading
+                palette = None
+                if self.loop_format == "gif":
+                    palette = await loop.run_in_executor(
+                        self._pil_executor, _gif_palette, *await radar_tasks[0]
+                    )
 
-        for _ in range(3):
-            radar_layers.append(radar_layers[-1])
+                async def prepare_frame(radar_task):
+                    png, frame = await radar_task
+                    return await loop.run_in_executor(
+                        self._pil_executor, _loop_frame, png, frame, palette
+                    )
 
-        return await asyncio.get_running_loop().run_in_executor(None, create_gif)
+                # Each frame is prepared for the encoder as soon as it is composed
+                frames = await asyncio.gather(*map(prepare_frame, radar_tasks))
+            finally:
+                # If a frame failed or the loop was cancelled, stop waiting on
+                # the other frames, and collect them so that their errors
+                # aren't logged as never retrieved
+                for radar_task in radar_tasks:
+                    radar_task.cancel()
+                await asyncio.gather(*radar_tasks, return_exceptions=True)
+
+        return await loop.run_in_executor(self._pil_executor, create_loop)
@@ -0,0 +1,16 @@
+from datetime import timedelta
+
+from env_canada.ec_cache import Cache
+
+
+def test_cache_expiry():
+    Cache.add("test-fresh", "fresh", timedelta(minutes=5))
+    Cache.add("test-stale", "stale", timedelta(minutes=-5))
+    assert Cache.get("test-fresh") == "fresh"
+    assert Cache.get("test-stale") is None
+
+
+def test_cache_readd():
+    Cache.add("test-readd", "old", timedelta(minutes=-5))
+    Cache.add("test-readd", "new", timedelta(minutes=5))
+    assert Cache.get("test-readd") == "new"
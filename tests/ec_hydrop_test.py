@@ -1,6 +1,8 @@
 import asyncio
 from datetime import datetime
+from types import SimpleNamespace
 
+import numpy as np
 import pytest
 
 from env_canada import ECHydro, ec_hydro
@@ -25,6 +27,31 @@ def test_echydro(init_parameters):
         assert isinstance(hydro.measurements["discharge"]["value"], float)
 
 
+def test_read_csv():
+    async def lines():
+        yield b"\xef\xbb\xbfID,Name / Nom,Latitude\n"
+        yield b'01AA,"Quoted\n'
+        yield b'newline",45.0\n'
+        yield b"02BB,Plain,46.0,extra,more\n"
+
+    async def read_rows():
+        response = SimpleNamespace(content=lines())
+        return [row async for row in ec_hydro._read_csv(response)]
+
+    rows = asyncio.run(read_rows())
+    assert rows[0] == {"ID": "01AA", "Name": "Quoted\nnewline", "Latitude": "45.0"}
+    assert rows[1][None] == ["extra", "more"]
+
+
+def test_haversine():
+    lats = np.radians([45.42, 49.9, 45.5])
+    lons = np.radians([-75.7, -97.14, -73.57])
+    distances = ec_hydro._haversine(
+        np.radians(45.4), np.radians(-75.6), lats, lons, np.cos(lats)
+    )
+    assert int(np.argmin(distances)) == 0
+
+
 @pytest.fixture()
 def test_hydro():
     return ECHydro(province="ON", station="02KF005")
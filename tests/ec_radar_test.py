@@ -1,11 +1,13 @@
 import asyncio
-from datetime import date, datetime
+import threading
+from datetime import date, datetime, timedelta, timezone
 from io import BytesIO
 
+import numpy as np
 import pytest
 from PIL import Image
 
-from env_canada import ECRadar
+from env_canada import ECRadar, ec_radar
 
 
 @pytest.mark.parametrize(
@@ -46,6 +48,124 @@ def test_get_loop(test_radar):
     assert image.format == "GIF" and image.is_animated
 
 
+def test_get_loop_webp():
+    radar = ECRadar(coordinates=(50, -100), loop_format="webp")
+    loop = asyncio.run(radar.get_loop())
+    image = Image.open(BytesIO(loop))
+    assert image.format == "WEBP" and image.is_animated
+
+
+def test_get_loop_frame_error(test_radar, monkeypatch):
+    async def get_background():
+        return None, None
+
+    async def get_dimensions():
+        end = datetime.now(timezone.utc)
+        return end - 2 * ec_radar.radar_interval, end
+
+    async def get_radar_image(frame_time, background):
+        if frame_time < datetime.now(timezone.utc) - ec_radar.radar_interval:
+            raise ValueError("frame failed")
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(test_radar, "_get_background", get_background)
+    monkeypatch.setattr(test_radar, "_get_dimensions", get_dimensions)
+    monkeypatch.setattr(test_radar, "_get_radar_image", get_radar_image)
+
+    async def get_loop():
+        with pytest.raises(ValueError):
+            await test_radar.get_loop()
+        return asyncio.all_tasks() - {asyncio.current_task()}
+
+    # The frames still downloading were cancelled, not left running
+    assert asyncio.run(get_loop()) == set()
+
+
+def test_session_context():
+    async def get_frame_and_loop():
+        async with ECRadar(coordinates=(50, -100)) as radar:
+            session = radar._session
+            frame = await radar.get_latest_frame()
+            loop = await radar.get_loop()
+        return session, radar._session, frame, loop
+
+    session, closed, frame, loop = asyncio.run(get_frame_and_loop())
+    assert session.closed and closed is None
+    assert Image.open(BytesIO(frame)).format == "PNG"
+    assert Image.open(BytesIO(loop)).format == "GIF"
+
+
+def test_coalesce(test_radar):
+    calls = []
+
+    async def fetch(session):
+        calls.append(session)
+        await asyncio.sleep(0)
+        return "fetched"
+
+    async def fetch_twice():
+        results = await asyncio.gather(
+            test_radar._coalesce("test-key", fetch),
+            test_radar._coalesce("test-key", fetch),
+        )
+        return results, ECRadar._in_flight[asyncio.get_running_loop()]
+
+    results, in_flight = asyncio.run(fetch_twice())
+    assert results == ["fetched", "fetched"]
+    assert len(calls) == 1
+    assert "test-key" not in in_flight
+
+
+def test_coalesce_cancelled_caller():
+    first, second = ECRadar(coordinates=(50, -100)), ECRadar(coordinates=(50, -100))
+
+    async def fetch(session):
+        await asyncio.sleep(0.01)
+        return session.closed
+
+    async def get(radar):
+        async with radar._session_scope():
+            return await radar._coalesce("test-cancel", fetch)
+
+    async def cancel_first():
+        first_task = asyncio.ensure_future(get(first))
+        second_task = asyncio.ensure_future(get(second))
+        await asyncio.sleep(0)
+        first_task.cancel()
+        return await second_task
+
+    # The fetch started by the cancelled radar still has an open session
+    assert asyncio.run(cancel_first()) is False
+    assert not ECRadar._sessions
+
+
+def test_session_per_loop():
+    held, release = threading.Event(), threading.Event()
+    sessions = []
+
+    async def hold_session():
+        async with ECRadar(coordinates=(50, -100)) as radar:
+            sessions.append(radar._session)
+            held.set()
+            await asyncio.get_running_loop().run_in_executor(None, release.wait)
+
+    async def lease_session():
+        async with ECRadar(coordinates=(50, -100))._session_scope() as session:
+            return session
+
+    # A radar on another thread's loop must not hand its session to this one
+    thread = threading.Thread(target=asyncio.run, args=(hold_session(),))
+    thread.start()
+    try:
+        assert held.wait(timeout=10)
+        sessions.append(asyncio.run(lease_session()))
+    finally:
+        release.set()
+        thread.join()
+    assert sessions[0] is not sessions[1]
+    assert sessions[0].closed and sessions[1].closed
+
+
 def test_set_precip_type(test_radar):
     test_radar.precip_type = "auto"
     assert test_radar.precip_type[0] == "auto"
@@ -54,3 +174,96 @@ def test_set_precip_type(test_radar):
         assert test_radar.precip_type[1] == "rain"
     else:
         assert test_radar.precip_type[1] == "snow"
+
+
+def test_get_precip_type_keeps_state(test_radar):
+    test_radar._precip_type_actual = "unchanged"
+    assert test_radar.precip_type[0] == "auto"
+    assert test_radar._precip_type_actual == "unchanged"
+
+
+def test_format_frame_time():
+    frame_time = datetime(2024, 3, 5, 7, 6, 59, tzinfo=timezone.utc)
+    assert ec_radar._format_frame_time(frame_time) == "2024-03-05T07:06:00Z"
+
+
+def test_blend_radar():
+    base = np.asarray(Image.new("RGB", (2, 1), (200, 100, 0)))
+    radar = Image.new("RGBA", (2, 1), (0, 0, 0, 0))
+    radar.putpixel((1, 0), (0, 0, 255, 255))
+
+    blended = ec_radar._blend_radar(base, radar, 100)
+    assert blended.mode == "RGB"
+    assert blended.getpixel((0, 0)) == (200, 100, 0)
+    assert blended.getpixel((1, 0)) == (0, 0, 255)
+    assert base[0, 1].tolist() == [200, 100, 0]
+
+    blended = ec_radar._blend_radar(base, radar, 0)
+    assert blended.getpixel((1, 0)) == (200, 100, 0)
+
+    clear = Image.new("RGBA", (2, 1), (0, 0, 0, 0))
+    assert ec_radar._blend_radar(base, clear, 100).tobytes() == base.tobytes()
+
+    blended = ec_radar._blend_radar(base, radar, 100, hidden_box=(1, 0, 2, 1))
+    assert blended.getpixel((1, 0)) == (200, 100, 0)
+
+
+def test_blend_palette_radar():
+    base = np.asarray(Image.new("RGB", (2, 1), (200, 100, 0)))
+    radar = Image.new("P", (2, 1), 0)
+    radar.putpalette([0, 0, 0, 0, 0, 255])
+    radar.putpixel((1, 0), 1)
+    radar.info["transparency"] = 0
+
+    blended = ec_radar._blend_radar(base, radar, 100)
+    assert blended.getpixel((0, 0)) == (200, 100, 0)
+    assert blended.getpixel((1, 0)) == (0, 0, 255)
+
+
+def test_paste_legend():
+    base = Image.new("RGB", (4, 3), (200, 100, 0))
+    legend = BytesIO()
+    Image.new("RGB", (1, 2), (0, 0, 255)).save(legend, format="PNG")
+
+    background, legend_box = ec_radar._paste_legend(base, legend.getvalue())
+    assert legend_box == (3, 0, 4, 2)
+    assert background.getpixel((3, 1)) == (0, 0, 255)
+    assert background.getpixel((3, 2)) == (200, 100, 0)
+    assert base.getpixel((3, 1)) == (200, 100, 0)
+
+
+def test_cache_file(tmp_path):
+    path = str(tmp_path / "maps" / "basemap.png")
+    assert ec_radar._read_cache_file(path, timedelta(days=7)) is None
+
+    ec_radar._write_cache_file(path, b"png")
+    assert ec_radar._read_cache_file(path, timedelta(days=7)) == b"png"
+    assert ec_radar._read_cache_file(path, timedelta(0)) is None
+
+    # A write that fails leaves no temporary file behind
+    (tmp_path / "taken").mkdir()
+    ec_radar._write_cache_file(str(tmp_path / "taken"), b"png")
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["maps", "taken"]
+
+
+def test_parse_dimensions():
+    capabilities = b"""<?xml version="1.0" encoding="UTF-8"?>
+<WMS_Capabilities xmlns="http://www.opengis.net/wms" version="1.3.0">
+  <Capability>
+    <Layer>
+      <Name>RADAR</Name>
+      <Layer>
+        <Name>RADAR_1KM_RRAI</Name>
+        <Dimension name="time">2024-03-05T04:00:00Z/2024-03-05T07:00:00Z/PT6M</Dimension>
+      </Layer>
+      <Layer>
+        <Name>RADAR_1KM_RSNO</Name>
+        <Dimension name="time">2024-03-05T04:06:00Z/2024-03-05T07:06:00Z/PT6M</Dimension>
+      </Layer>
+    </Layer>
+  </Capability>
+</WMS_Capabilities>"""
+    start, end = ec_radar._parse_dimensions(capabilities, "RADAR_1KM_RSNO")
+    assert start == datetime(2024, 3, 5, 4, 6, tzinfo=timezone.utc)
+    assert end == datetime(2024, 3, 5, 7, 6, tzinfo=timezone.utc)
+    assert ec_radar._parse_dimensions(capabilities, "RADAR_1KM_RDBR") is None